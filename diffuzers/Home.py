@@ -4,7 +4,7 @@ import streamlit as st
 from loguru import logger
 
 from diffuzers import utils
-from diffuzers.x2image import X2Image
+from diffuzers.x2image import build_x2image, quantization_available
 
 
 def parse_args():
@@ -45,6 +45,27 @@ def x2img_app():
                 index=0 if st.session_state.get("x2img_custom_pipeline") in (None, "Vanilla") else 1,
             )
 
+        # quantization, compilation and low vram mode are only supported on cuda
+        quantization = "None"
+        compile_model = False
+        low_vram = False
+        if st.session_state.device == "cuda":
+            if quantization_available():
+                quantization_options = ["None", "int8", "nf4"]
+                quantization = st.selectbox(
+                    "UNet quantization",
+                    options=quantization_options,
+                    index=quantization_options.index(st.session_state.get("x2img_quantization") or "None"),
+                )
+            compile_model = st.checkbox(
+                "Compile model with torch.compile (slow first run)",
+                value=st.session_state.get("x2img_compile_model", False),
+            )
+            low_vram = st.checkbox(
+                "Low VRAM mode (offload model to cpu)",
+                value=st.session_state.get("x2img_low_vram", False),
+            )
+
         with st.expander("Textual Inversion (Optional)"):
             token_identifier = st.text_input(
                 "Token identifier",
@@ -63,17 +84,26 @@ def x2img_app():
     if submit:
         st.session_state.x2img_model = model
         st.session_state.x2img_custom_pipeline = custom_pipeline
+        st.session_state.x2img_quantization = quantization
+        st.session_state.x2img_compile_model = compile_model
+        st.session_state.x2img_low_vram = low_vram
         st.session_state.textual_inversion_token_identifier = token_identifier
         st.session_state.textual_inversion_embeddings = embeddings
         cpipe = "lpw_stable_diffusion" if custom_pipeline == "Long Prompt Weighting" else None
+        if compile_model and (low_vram or quantization != "None"):
+            st.error("Model compilation cannot be combined with low VRAM mode or quantization")
+            st.stop()
         with st.spinner("Loading model..."):
-            x2img = X2Image(
+            x2img = build_x2image(
                 model=model,
                 device=st.session_state.device,
                 output_path=st.session_state.output_path,
                 custom_pipeline=cpipe,
                 token_identifier=token_identifier,
                 embeddings_url=embeddings,
+                quantization=None if quantization == "None" else quantization,
+                compile_model=compile_model,
+                low_vram=low_vram,
             )
             st.session_state.x2img = x2img
     if "x2img" in st.session_state:
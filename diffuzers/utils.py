@@ -1,8 +1,11 @@
 import base64
 import gc
+import hashlib
 import os
+import shutil
 import tempfile
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 import requests
@@ -15,6 +18,9 @@ from st_clickable_images import clickable_images
 
 no_safety_checker = None
 
+# shared so repeated downloads reuse pooled connections
+SESSION = requests.Session()
+
 
 CODE_OF_CONDUCT = """
 ## Code of conduct
@@ -49,8 +55,10 @@ def create_base_page():
     st.markdown("Welcome to Diffuzers! A web app for [🤗 Diffusers](https://github.com/huggingface/diffusers)")
 
 
-def download_file(file_url):
-    r = requests.get(file_url, stream=True)
+def download_file(file_url, session=None):
+    session = SESSION if session is None else session
+    r = session.get(file_url, stream=True, timeout=30)
+    r.raise_for_status()
     with tempfile.NamedTemporaryFile(delete=False) as tmp:
         for chunk in r.iter_content(chunk_size=1024):
             if chunk:  # filter out keep-alive new chunks
@@ -64,6 +72,20 @@ def cache_folder():
     return _cache_folder
 
 
+def download_cached_file(file_url, subfolder):
+    # files are keyed on the url, so the same url is only downloaded once
+    _cache_folder = os.path.join(cache_folder(), subfolder)
+    os.makedirs(_cache_folder, exist_ok=True)
+    url_hash = hashlib.sha256(file_url.encode("utf-8")).hexdigest()
+    output_path = os.path.join(_cache_folder, f"{url_hash}.bin")
+    if os.path.exists(output_path):
+        logger.info(f"Using cached {file_url} from {output_path}")
+        return output_path
+    temp_file = download_file(file_url)
+    shutil.move(temp_file, output_path)
+    return output_path
+
+
 def clear_memory(preserve):
     torch.cuda.empty_cache()
     gc.collect()
@@ -73,7 +95,7 @@ def clear_memory(preserve):
             del st.session_state[key]
 
 
-def save_images(images, module, metadata, output_path):
+def save_images(images, module, metadata, output_path, pnginfo=None):
     if output_path is None:
         logger.warning("No output path specified, skipping saving images")
         return
@@ -82,15 +104,22 @@ def save_images(images, module, metadata, output_path):
     os.makedirs(f"{output_path}/{module}", exist_ok=True)
     os.makedirs(f"{output_path}/{module}/{current_datetime}", exist_ok=True)
 
-    _metadata = PngInfo()
-    _metadata.add_text("text2img", metadata)
+    # callers that already built the png metadata can pass it to avoid building it again
+    if pnginfo is None:
+        pnginfo = PngInfo()
+        pnginfo.add_text("text2img", metadata)
 
-    for i, img in enumerate(images):
+    def _save(i, img):
         img.save(
             f"{output_path}/{module}/{current_datetime}/{i}.png",
-            pnginfo=_metadata,
+            pnginfo=pnginfo,
+            compress_level=1,
         )
 
+    # png encoding releases the gil, so the images can be written in parallel
+    with ThreadPoolExecutor() as executor:
+        list(executor.map(_save, range(len(images)), images))
+
     # save metadata as text file
     with open(f"{output_path}/{module}/{current_datetime}/metadata.txt", "w") as f:
         f.write(metadata)
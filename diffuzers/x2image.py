@@ -1,13 +1,11 @@
-import base64
 import gc
 import json
 import os
-import tempfile
-from dataclasses import dataclass
+import threading
+from dataclasses import asdict, dataclass
 from io import BytesIO
-from typing import Optional
+from typing import Optional, Tuple
 
-import requests
 import streamlit as st
 import torch
 from diffusers import (
@@ -17,16 +15,50 @@ from diffusers import (
     StableDiffusionImg2ImgPipeline,
     StableDiffusionPipeline,
 )
+from diffusers.utils import is_xformers_available
 from loguru import logger
+from packaging import version
 from PIL import Image
 from PIL.PngImagePlugin import PngInfo
-from st_clickable_images import clickable_images
 
 from diffuzers import utils
 
 
+# rough activation memory per pixel of a generated image, classifier free guidance included
+# (~1GB for a 512x512 image), used to split large text2img requests into batches
+ACTIVATION_BYTES_PER_PIXEL = 4096
+# share of the gpu memory budgeted for activations, the rest holds the weights and allocator overhead.
+# in low vram mode the weights are offloaded and only one submodule is on the gpu at a time
+ACTIVATION_MEMORY_FRACTION = 0.5
+LOW_VRAM_ACTIVATION_MEMORY_FRACTION = 0.75
+
+
+# must be set before the first cuda allocation, older torch versions reject the option
+if version.parse(torch.__version__.split("+")[0]) >= version.parse("2.1"):
+    os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True")
+
+
+def load_embeds_file(learned_embeds_path):
+    with open(learned_embeds_path, "rb") as f:
+        header = f.read(9)
+    # safetensors files start with the 8 byte length of a json header
+    if header[8:9] == b"{":
+        from safetensors.torch import load_file
+
+        return load_file(learned_embeds_path, device="cpu")
+
+    torch_version = version.parse(torch.__version__.split("+")[0])
+    load_kwargs = {}
+    if torch_version >= version.parse("1.13"):
+        load_kwargs["weights_only"] = True
+    # mmap only works for the zip based format, which starts like any zip file
+    if torch_version >= version.parse("2.1") and header[:2] == b"PK":
+        load_kwargs["mmap"] = True
+    return torch.load(learned_embeds_path, map_location="cpu", **load_kwargs)
+
+
 def load_embed(learned_embeds_path, text_encoder, tokenizer, token=None):
-    loaded_learned_embeds = torch.load(learned_embeds_path, map_location="cpu")
+    loaded_learned_embeds = load_embeds_file(learned_embeds_path)
     if len(loaded_learned_embeds) > 2:
         embeds = loaded_learned_embeds["string_to_param"]["*"][-1, :]
     else:
@@ -54,6 +86,90 @@ def load_embed(learned_embeds_path, text_encoder, tokenizer, token=None):
     return token
 
 
+def quantization_available():
+    # BitsAndBytesConfig was added in diffusers 0.31, which the pinned requirements cannot install
+    try:
+        import bitsandbytes  # noqa: F401
+        from diffusers import BitsAndBytesConfig  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def load_quantized_unet(model, quantization, use_auth_token=None):
+    # weight-only quantization of the unet
+    try:
+        from diffusers import BitsAndBytesConfig, UNet2DConditionModel
+    except ImportError:
+        raise ImportError("UNet quantization requires diffusers>=0.31.0 and bitsandbytes>=0.43.3") from None
+
+    if quantization == "int8":
+        bnb_config = BitsAndBytesConfig(load_in_8bit=True)
+    elif quantization == "nf4":
+        bnb_config = BitsAndBytesConfig(
+            load_in_4bit=True,
+            bnb_4bit_quant_type="nf4",
+            bnb_4bit_compute_dtype=torch.float16,
+        )
+    else:
+        raise ValueError(f"Quantization {quantization} not supported")
+
+    return UNet2DConditionModel.from_pretrained(
+        model,
+        subfolder="unet",
+        quantization_config=bnb_config,
+        torch_dtype=torch.float16,
+        use_auth_token=use_auth_token,
+    )
+
+
+def upcast_vae_decoder(vae):
+    # fp16 vae decoding can overflow into nan (black) images, run only the decoder in fp32
+    # and keep the encoder in fp16 so img2img latents still match the unet dtype
+    vae.post_quant_conv.to(dtype=torch.float32)
+    vae.decoder.to(dtype=torch.float32)
+    decode = vae.decode
+
+    def _decode(z, *args, **kwargs):
+        return decode(z.to(torch.float32), *args, **kwargs)
+
+    vae.decode = _decode
+
+
+@dataclass(frozen=True)
+class GenerationMeta:
+    # dataclass(slots=True) needs python 3.10
+    __slots__ = (
+        "prompt",
+        "negative_prompt",
+        "scheduler",
+        "image_size",
+        "num_images",
+        "guidance_scale",
+        "steps",
+        "seed",
+    )
+    prompt: str
+    negative_prompt: str
+    scheduler: str
+    image_size: Optional[Tuple[int, int]]
+    num_images: int
+    guidance_scale: float
+    steps: int
+    seed: int
+
+    def to_json(self):
+        return json.dumps({key: value for key, value in asdict(self).items() if value is not None})
+
+
+# st.cache_resource replaced st.experimental_singleton in streamlit 1.18, a single entry keeps
+# switching models from piling up pipelines in gpu memory
+if hasattr(st, "cache_resource"):
+    cache_resource = st.cache_resource(max_entries=1)
+else:
+    cache_resource = st.experimental_singleton(max_entries=1)
+
+
 @dataclass
 class X2Image:
     device: Optional[str] = None
@@ -62,17 +178,60 @@ class X2Image:
     custom_pipeline: Optional[str] = None
     embeddings_url: Optional[str] = None
     token_identifier: Optional[str] = None
+    quantization: Optional[str] = None
+    compile_model: bool = False
+    low_vram: bool = False
 
     def __str__(self) -> str:
         return f"X2Image(model={self.model}, pipeline={self.custom_pipeline})"
 
     def __post_init__(self):
-        self.text2img_pipeline = DiffusionPipeline.from_pretrained(
-            self.model,
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
+
+        if self.low_vram and self.device != "cuda":
+            raise ValueError("Low VRAM mode is only supported on cuda")
+        if self.low_vram and self.compile_model:
+            raise ValueError("Model compilation cannot be combined with low VRAM mode")
+
+        if self.compile_model and self.quantization is not None:
+            raise ValueError("Model compilation cannot be combined with quantization")
+
+        pipeline_kwargs = {}
+        if self.quantization is not None:
+            if self.device != "cuda":
+                raise ValueError("Quantization is only supported on cuda")
+            logger.info(f"Loading {self.quantization} quantized unet")
+            pipeline_kwargs["unet"] = load_quantized_unet(
+                self.model,
+                self.quantization,
+                use_auth_token=utils.use_auth_token(),
+            )
+
+        pipeline_kwargs.update(
             torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
             custom_pipeline=self.custom_pipeline,
             use_auth_token=utils.use_auth_token(),
+            low_cpu_mem_usage=True,
         )
+        if self.device == "cuda":
+            # fp16 safetensors weights skip the fp32 copy on cpu, not every model publishes them
+            pipeline_kwargs.update(variant="fp16", use_safetensors=True)
+        try:
+            self.text2img_pipeline = DiffusionPipeline.from_pretrained(self.model, **pipeline_kwargs)
+        except (OSError, ValueError) as e:
+            # only retry when the fp16 safetensors files are missing, not for e.g. a bad model id
+            if "variant" not in pipeline_kwargs or not any(
+                reason in str(e) for reason in ("variant", "fp16", "safetensors")
+            ):
+                raise
+            logger.warning(f"Could not load fp16 safetensors weights ({e}), loading default weights")
+            pipeline_kwargs.pop("variant")
+            pipeline_kwargs.pop("use_safetensors")
+            self.text2img_pipeline = DiffusionPipeline.from_pretrained(self.model, **pipeline_kwargs)
+        self.text2img_pipeline.safety_checker = utils.no_safety_checker
+        # img2img is built from the very same modules, so everything done to them below
+        # (device placement, attention, compilation, embeddings) is done only once
         components = self.text2img_pipeline.components
 
         if isinstance(self.text2img_pipeline, StableDiffusionPipeline):
@@ -83,53 +242,148 @@ class X2Image:
             self.img2img_pipeline = None
             logger.error("Model type not supported, img2img pipeline not created")
 
-        self.text2img_pipeline.to(self.device)
-        self.text2img_pipeline.safety_checker = utils.no_safety_checker
-        self.img2img_pipeline.to(self.device)
-        self.img2img_pipeline.safety_checker = utils.no_safety_checker
-
-        self.compatible_schedulers = {
-            scheduler.__name__: scheduler for scheduler in self.text2img_pipeline.scheduler.compatibles
-        }
-
+        # embeddings are loaded before offloading, which moves the weights to the meta device,
+        # and before compilation and warmup
         if len(self.embeddings_url) > 0 and len(self.token_identifier) > 0:
             # download the embeddings
-            self.embeddings_path = utils.download_file(self.embeddings_url)
+            self.embeddings_path = utils.download_cached_file(self.embeddings_url, subfolder="embeddings")
             load_embed(
                 learned_embeds_path=self.embeddings_path,
-                text_encoder=self.pipeline.text_encoder,
-                tokenizer=self.pipeline.tokenizer,
+                text_encoder=self.text2img_pipeline.text_encoder,
+                tokenizer=self.text2img_pipeline.tokenizer,
                 token=self.token_identifier,
             )
 
+        # text2img-only pipelines are not guaranteed to have a unet or a vae (e.g. kandinsky uses movq)
+        unet = getattr(self.text2img_pipeline, "unet", None)
+        vae = getattr(self.text2img_pipeline, "vae", None)
+
+        if self.low_vram:
+            # the offload hooks live on the shared modules, so they also cover img2img
+            self._enable_cpu_offload(self.text2img_pipeline)
+            if vae is not None:
+                self.text2img_pipeline.enable_vae_slicing()
+                if hasattr(self.text2img_pipeline, "enable_vae_tiling"):
+                    self.text2img_pipeline.enable_vae_tiling()
+        else:
+            self.text2img_pipeline.to(self.device)
+        if self.img2img_pipeline is not None:
+            assert self.text2img_pipeline.unet is self.img2img_pipeline.unet
+
+        self._set_attention()
+
+        # modules are shared with img2img, so this applies to both pipelines
+        if unet is not None and self.quantization is None:
+            unet.to(memory_format=torch.channels_last)
+        if vae is not None:
+            vae.to(memory_format=torch.channels_last)
+            if self.device == "cuda":
+                upcast_vae_decoder(vae)
+
+        if self.compile_model and self.device == "cuda":
+            if hasattr(torch, "compile"):
+                logger.info("Compiling unet and vae decoder, the first generation will be slow")
+                # shapes change with image size and batch size, let dynamo mark them dynamic
+                # after the first recompilation instead of recompiling for every shape
+                if unet is not None:
+                    self.text2img_pipeline.unet = torch.compile(unet, mode="reduce-overhead", fullgraph=False)
+                if vae is not None:
+                    vae.decode = torch.compile(vae.decode, mode="reduce-overhead", fullgraph=False)
+                # img2img shares the modules, point it to the compiled unet so it is compiled only once
+                if self.img2img_pipeline is not None:
+                    self.img2img_pipeline.unet = self.text2img_pipeline.unet
+                # warmup with the app defaults: 512x512, one image, classifier free guidance
+                prompt = "a photo of an astronaut riding a horse on mars"
+                with torch.inference_mode():
+                    _ = self.text2img_pipeline(
+                        prompt,
+                        height=512,
+                        width=512,
+                        num_images_per_prompt=1,
+                        guidance_scale=7.5,
+                        num_inference_steps=2,
+                    )
+            else:
+                logger.warning("torch.compile requires torch>=2.0, skipping compilation")
+
+        # mps uses the global generator, everything else reseeds this one on every generation
+        self._generator = torch.Generator(device=self.device) if self.device != "mps" else None
+        self._encode_cache = {}
+        # one instance is shared by all streamlit sessions and api requests, generations swap the
+        # scheduler, reseed the generator and use the caches, so they must not run concurrently
+        self._lock = threading.Lock()
+        self._scheduler_cache = {}
+
+        self.compatible_schedulers = {
+            scheduler.__name__: scheduler for scheduler in self.text2img_pipeline.scheduler.compatibles
+        }
+
         if self.device == "mps":
-            self.text2img_pipeline.enable_attention_slicing()
+            # the warmup only needs to build the mps graphs, so keep it as small as possible
             prompt = "a photo of an astronaut riding a horse on mars"
-            _ = self.text2img_pipeline(prompt, num_inference_steps=2)
+            _ = self.text2img_pipeline(prompt, height=64, width=64, num_inference_steps=1)
 
-            self.img2img_pipeline.enable_attention_slicing()
+        if self.device == "mps" and self.img2img_pipeline is not None:
             url = "https://raw.githubusercontent.com/CompVis/stable-diffusion/main/assets/stable-samples/img2img/sketch-mountains-input.jpg"
-            response = requests.get(url)
+            response = utils.SESSION.get(url, timeout=30)
             init_image = Image.open(BytesIO(response.content)).convert("RGB")
-            init_image.thumbnail((768, 768))
+            init_image = init_image.resize((64, 64))
             prompt = "A fantasy landscape, trending on artstation"
+            # strength 1.0 so that the single inference step is not skipped
             _ = self.img2img_pipeline(
                 prompt=prompt,
                 image=init_image,
-                strength=0.75,
+                strength=1.0,
                 guidance_scale=7.5,
-                num_inference_steps=2,
+                num_inference_steps=1,
             )
 
+    @staticmethod
+    def _enable_cpu_offload(pipeline):
+        # model offload keeps whole submodules on the gpu while they run, sequential offload is
+        # slower but the only option on older diffusers
+        if hasattr(pipeline, "enable_model_cpu_offload"):
+            pipeline.enable_model_cpu_offload()
+        else:
+            pipeline.enable_sequential_cpu_offload()
+
+    def _set_attention(self):
+        # unet is shared between the pipelines, so setting the processor once is enough
+        unet = getattr(self.text2img_pipeline, "unet", None)
+        if unet is not None and hasattr(torch.nn.functional, "scaled_dot_product_attention"):
+            try:
+                from diffusers.models.attention_processor import AttnProcessor2_0
+            except ImportError:
+                AttnProcessor2_0 = None
+            if AttnProcessor2_0 is not None:
+                logger.info("Using scaled dot product attention")
+                unet.set_attn_processor(AttnProcessor2_0())
+                return
+
+        if (
+            self.device == "cuda"
+            and is_xformers_available()
+            and hasattr(self.text2img_pipeline, "enable_xformers_memory_efficient_attention")
+        ):
+            logger.info("Using xformers memory efficient attention")
+            self.text2img_pipeline.enable_xformers_memory_efficient_attention()
+        elif self.device == "mps" and hasattr(self.text2img_pipeline, "enable_attention_slicing"):
+            self.text2img_pipeline.enable_attention_slicing()
+
     def _set_scheduler(self, pipeline_name, scheduler_name):
         if pipeline_name == "text2img":
             scheduler_config = self.text2img_pipeline.scheduler.config
         elif pipeline_name == "img2img":
+            if self.img2img_pipeline is None:
+                raise ValueError(f"img2img is not supported for {self.model}")
             scheduler_config = self.img2img_pipeline.scheduler.config
         else:
             raise ValueError(f"Pipeline {pipeline_name} not supported")
 
-        scheduler = self.compatible_schedulers[scheduler_name].from_config(scheduler_config)
+        key = (pipeline_name, scheduler_name)
+        if key not in self._scheduler_cache:
+            self._scheduler_cache[key] = self.compatible_schedulers[scheduler_name].from_config(scheduler_config)
+        scheduler = self._scheduler_cache[key]
 
         if pipeline_name == "text2img":
             self.text2img_pipeline.scheduler = scheduler
@@ -142,14 +396,61 @@ class X2Image:
             generator = torch.manual_seed(seed)
             num_images = 1
         else:
-            generator = torch.Generator(device=self.device).manual_seed(seed)
+            generator = self._generator.manual_seed(seed)
         num_images = int(num_images)
         return generator, num_images
 
+    def _prompt_kwargs(self, prompt, negative_prompt):
+        # only the sd and alt diffusion encode_prompt signatures are known (those are the models
+        # with an img2img pipeline), custom pipelines (e.g. long prompt weighting) do their own parsing
+        if (
+            self.custom_pipeline is not None
+            or self.img2img_pipeline is None
+            or not hasattr(self.text2img_pipeline, "encode_prompt")
+        ):
+            return {"prompt": prompt, "negative_prompt": negative_prompt}
+
+        key = (prompt, negative_prompt)
+        if key not in self._encode_cache:
+            if len(self._encode_cache) >= 32:
+                self._encode_cache.clear()
+            with torch.inference_mode():
+                prompt_embeds, negative_prompt_embeds = self.text2img_pipeline.encode_prompt(
+                    prompt,
+                    device=self.device,
+                    num_images_per_prompt=1,
+                    do_classifier_free_guidance=True,
+                    negative_prompt=negative_prompt,
+                )
+            self._encode_cache[key] = (prompt_embeds, negative_prompt_embeds)
+
+        prompt_embeds, negative_prompt_embeds = self._encode_cache[key]
+        return {"prompt_embeds": prompt_embeds, "negative_prompt_embeds": negative_prompt_embeds}
+
+    def _max_batch_size(self, image_size, num_images):
+        if self.device != "cuda":
+            return num_images
+        # the split changes the latents drawn from the generator, so it must only depend on the
+        # gpu, the settings and the request (not on free memory) for a seed to reproduce the same images
+        bytes_per_image = image_size[0] * image_size[1] * ACTIVATION_BYTES_PER_PIXEL
+        total_memory = torch.cuda.get_device_properties(torch.cuda.current_device()).total_memory
+        memory_fraction = LOW_VRAM_ACTIVATION_MEMORY_FRACTION if self.low_vram else ACTIVATION_MEMORY_FRACTION
+        return max(1, min(num_images, int(total_memory * memory_fraction) // bytes_per_image))
+
+    def _run_pipeline(self, pipeline, **kwargs):
+        try:
+            with torch.inference_mode():
+                return pipeline(**kwargs).images
+        except getattr(torch.cuda, "OutOfMemoryError", RuntimeError) as e:
+            if "out of memory" not in str(e):
+                raise
+            # give the memory back only when we actually ran out of it
+            torch.cuda.empty_cache()
+            gc.collect()
+            raise
+
     def _postgen(self, metadata, output_images, pipeline_name):
-        torch.cuda.empty_cache()
-        gc.collect()
-        metadata = json.dumps(metadata)
+        metadata = metadata.to_json()
         _metadata = PngInfo()
         _metadata.add_text(pipeline_name, metadata)
         utils.save_images(
@@ -157,38 +458,45 @@ class X2Image:
             module=pipeline_name,
             metadata=metadata,
             output_path=self.output_path,
+            pnginfo=_metadata,
         )
         return output_images, _metadata
 
     def text2img_generate(
         self, prompt, negative_prompt, scheduler, image_size, num_images, guidance_scale, steps, seed
     ):
-        generator, num_images = self._pregen(
-            pipeline_name="text2img",
+        with self._lock:
+            generator, num_images = self._pregen(
+                pipeline_name="text2img",
+                scheduler=scheduler,
+                num_images=num_images,
+                seed=seed,
+            )
+            prompt_kwargs = self._prompt_kwargs(prompt, negative_prompt)
+            max_batch_size = self._max_batch_size(image_size, num_images)
+            output_images = []
+            # the generator is shared by all batches, so every image still gets a different latent
+            for start in range(0, num_images, max_batch_size):
+                output_images += self._run_pipeline(
+                    self.text2img_pipeline,
+                    **prompt_kwargs,
+                    width=image_size[1],
+                    height=image_size[0],
+                    num_inference_steps=steps,
+                    guidance_scale=guidance_scale,
+                    num_images_per_prompt=min(max_batch_size, num_images - start),
+                    generator=generator,
+                )
+        metadata = GenerationMeta(
+            prompt=prompt,
+            negative_prompt=negative_prompt,
             scheduler=scheduler,
+            image_size=image_size,
             num_images=num_images,
+            guidance_scale=guidance_scale,
+            steps=steps,
             seed=seed,
         )
-        output_images = self.text2img_pipeline(
-            prompt,
-            negative_prompt=negative_prompt,
-            width=image_size[1],
-            height=image_size[0],
-            num_inference_steps=steps,
-            guidance_scale=guidance_scale,
-            num_images_per_prompt=num_images,
-            generator=generator,
-        ).images
-        metadata = {
-            "prompt": prompt,
-            "negative_prompt": negative_prompt,
-            "scheduler": scheduler,
-            "image_size": image_size,
-            "num_images": num_images,
-            "guidance_scale": guidance_scale,
-            "steps": steps,
-            "seed": seed,
-        }
 
         output_images, _metadata = self._postgen(
             metadata=metadata,
@@ -200,31 +508,33 @@ class X2Image:
     def img2img_generate(
         self, prompt, image, strength, negative_prompt, scheduler, num_images, guidance_scale, steps, seed
     ):
-        generator, num_images = self._pregen(
-            pipeline_name="img2img",
+        with self._lock:
+            generator, num_images = self._pregen(
+                pipeline_name="img2img",
+                scheduler=scheduler,
+                num_images=num_images,
+                seed=seed,
+            )
+            output_images = self._run_pipeline(
+                self.img2img_pipeline,
+                image=image,
+                strength=strength,
+                **self._prompt_kwargs(prompt, negative_prompt),
+                num_inference_steps=steps,
+                guidance_scale=guidance_scale,
+                num_images_per_prompt=num_images,
+                generator=generator,
+            )
+        metadata = GenerationMeta(
+            prompt=prompt,
+            negative_prompt=negative_prompt,
             scheduler=scheduler,
+            image_size=None,
             num_images=num_images,
+            guidance_scale=guidance_scale,
+            steps=steps,
             seed=seed,
         )
-        output_images = self.img2img_pipeline(
-            prompt=prompt,
-            image=image,
-            strength=strength,
-            negative_prompt=negative_prompt,
-            num_inference_steps=steps,
-            guidance_scale=guidance_scale,
-            num_images_per_prompt=num_images,
-            generator=generator,
-        ).images
-        metadata = {
-            "prompt": prompt,
-            "negative_prompt": negative_prompt,
-            "scheduler": scheduler,
-            "num_images": num_images,
-            "guidance_scale": guidance_scale,
-            "steps": steps,
-            "seed": seed,
-        }
         output_images, _metadata = self._postgen(
             metadata=metadata,
             output_images=output_images,
@@ -240,29 +550,15 @@ class X2Image:
             )
         # col3, col4 = st.columns(2)
         # with col3:
-        input_image = st.file_uploader(
-            "Upload an image to use image2image instead (optional)", type=["png", "jpg", "jpeg"]
-        )
+        input_image = None
+        if self.img2img_pipeline is not None:
+            input_image = st.file_uploader(
+                "Upload an image to use image2image instead (optional)", type=["png", "jpg", "jpeg"]
+            )
         if input_image is not None:
             input_image = Image.open(input_image)
             pipeline_name = "img2img"
-            # display image using html
-            # convert image to base64
-            # st.markdown(f"<img src='data:image/png;base64,{input_image}' width='200'>", unsafe_allow_html=True)
-            # st.image(input_image, use_column_width=True)
-            with tempfile.TemporaryDirectory() as tmpdir:
-                gallery_images = []
-                input_image.save(os.path.join(tmpdir, "img.png"))
-                with open(os.path.join(tmpdir, "img.png"), "rb") as img:
-                    encoded = base64.b64encode(img.read()).decode()
-                    gallery_images.append(f"data:image/jpeg;base64,{encoded}")
-
-                _ = clickable_images(
-                    gallery_images,
-                    titles=[f"Image #{str(i)}" for i in range(len(gallery_images))],
-                    div_style={"display": "flex", "justify-content": "center", "flex-wrap": "wrap"},
-                    img_style={"margin": "5px", "height": "200px"},
-                )
+            st.image(input_image, width=200)
         else:
             pipeline_name = "text2img"
         # prompt = st.text_area("Prompt", "Blue elephant")
@@ -313,3 +609,30 @@ class X2Image:
                         seed=seed,
                     )
             utils.display_and_download_images(output_images, metadata, download_col)
+
+
+@cache_resource
+def build_x2image(
+    model,
+    device,
+    output_path,
+    custom_pipeline,
+    embeddings_url,
+    token_identifier,
+    quantization=None,
+    compile_model=False,
+    low_vram=False,
+):
+    # streamlit reruns the script on every interaction, use this instead of X2Image
+    # in the app so the loaded pipelines survive reruns
+    return X2Image(
+        model=model,
+        device=device,
+        output_path=output_path,
+        custom_pipeline=custom_pipeline,
+        embeddings_url=embeddings_url,
+        token_identifier=token_identifier,
+        quantization=quantization,
+        compile_model=compile_model,
+        low_vram=low_vram,
+    )